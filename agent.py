@@ -1,9 +1,75 @@
+import asyncio
+import atexit
+import inspect
 import json
-import re
-from llm_client import get_llm_response
+import logging
+import queue
+import threading
+from collections import OrderedDict
+from functools import partial
+from logging.handlers import QueueHandler, QueueListener
+from pydantic import ValidationError
+from http_client import close_async_client
+from llm_client import get_llm_response_async, stream_llm_response_async
 from device_controller import turn_on_device, turn_off_device
 from data_connectors import get_current_weather, get_current_time, get_current_date, get_news_headlines
-from tools_definition import get_tools_schema
+from tools_definition import get_tool_argument_models, get_tools_schema
+from agent_patterns import BATCH_INTENT_LINE, JSON_DECODER, JSON_FENCE, TOOL_COMMAND, TOOL_OBJECT, WHITESPACE
+from json_utils import json_dumps as _json_dumps, json_loads as _json_loads
+
+try:
+    from json_repair import repair_json
+except ImportError:  # json_repair is optional; without it malformed blocks are only scanned for tool call objects.
+    repair_json = None
+
+# Progress messages are DEBUG records and the logger defaults to WARNING, so they are skipped without being
+# formatted unless the level is lowered (as __main__ does).
+# Records go through a queue to a background listener thread, so writing them never blocks a request.
+log = logging.getLogger("agent")
+log.setLevel(logging.WARNING)
+log.propagate = False
+_log_queue = queue.SimpleQueue()
+log.addHandler(QueueHandler(_log_queue))
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+_log_listener = QueueListener(_log_queue, _log_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+# The prompts and the tool schema never change, so they are built once at import time.
+# They must stay free of any per-request data: providers cache identical prompt prefixes across calls.
+TOOLS_SCHEMA = get_tools_schema()
+
+# A simple prompt to classify the intent.
+ROUTER_SYSTEM_PROMPT = """
+    You are an intent classification system. Your job is to determine if a user's query requires calling a tool or if it's a general conversational query.
+    The user has access to tools for controlling home devices and getting information like weather, time, or news.
+
+    - If the query is a command, a request for specific data, or implies an action the tools can perform, respond with the single word: 'tool_use'.
+    - If the query is a simple greeting, a question about your identity or capabilities ('who are you'), or general small talk, respond with the single word: 'conversation'.
+
+    Analyze the user query and provide your classification.
+    """
+
+# Used when the router classifies the queries of several concurrent users in one call.
+ROUTER_BATCH_SYSTEM_PROMPT = ROUTER_SYSTEM_PROMPT + """
+    You will receive several numbered user queries, one per line. Classify each of them independently.
+    Respond with exactly one line per query, in the same order, formatted as '<number>. <classification>', for example:
+    1. tool_use
+    2. conversation
+    """
+
+TOOL_USE_SYSTEM_PROMPT = "You are a smart home assistant. First, call the necessary tools to fulfill the user's request based on their query."
+
+SUMMARY_INSTRUCTION = """
+        You have successfully executed all required tools and their results have been provided.
+        Now, formulate a single, cohesive, natural-language response to the user.
+        Your response MUST address all parts of the user's original query, including both confirming the actions you took AND answering any conversational questions.
+        Synthesize all information into a friendly and complete answer.
+        """
+
+CONVERSATION_SYSTEM_PROMPT = "You are a friendly and helpful smart home assistant. Keep your answers concise and polite."
+
 
 # Maps the function names from the tool schema to the actual Python functions.
 AVAILABLE_FUNCTIONS = {
@@ -16,55 +82,204 @@ AVAILABLE_FUNCTIONS = {
 }
 
 
-def _get_intent(user_message: str, preferred_service: str) -> str:
+def _build_dispatch_table() -> dict:
+    """
+    Resolves every tool once at import time into (function, argument model), so that dispatching
+    a call is a single dict lookup and its arguments are parsed and validated in one step.
+    """
+    argument_models = get_tool_argument_models()
+    return {name: (function, argument_models[name]) for name, function in AVAILABLE_FUNCTIONS.items()}
+
+
+_TOOL_DISPATCH = _build_dispatch_table()
+
+# Tools that change the state of a device. Calls to these on the same device_id must run in the
+# order the model emitted them; every other tool only reads data and can run fully concurrently.
+DEVICE_WRITE_TOOLS = {"call_turn_on_device", "call_turn_off_device"}
+
+
+def _parse_intent(content: str) -> str:
+    """Maps the router's free-text answer to 'tool_use' or 'conversation'."""
+    if "tool_use" in content.strip().lower():
+        return "tool_use"
+    # Default to conversation if classification is unclear
+    return "conversation"
+
+
+class _IntentBatcher:
+    """
+    Collects the router requests of concurrent users and classifies them with a single LLM call.
+    A request that arrives while the router is idle is sent immediately, so a lone user never waits
+    for the window. Requests that arrive while another one is pending or in flight are collected for
+    up to `window` seconds (or until `max_batch` are queued) and sent together as a numbered list.
+    An intent that came from a multi-query batch is flagged, because other users' text shared its prompt.
+    """
+
+    def __init__(self, window: float = 0.02, max_batch: int = 16):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}
+        self._in_flight = {}
+        self._futures = {}
+        # The event loop only keeps weak references to tasks, so running batches are held here until they finish.
+        self._tasks = set()
+
+    async def classify(self, normalized_message: str, preferred_service: str):
+        """
+        Returns (intent, batched): intent is 'tool_use' or 'conversation', or None if the LLM call failed;
+        batched is True if the message was classified together with other queries.
+        """
+        key = (normalized_message, preferred_service)
+        future = self._futures.get(key)
+        if future is None:
+            # Identical queries that are already pending or in flight share one classification.
+            loop = asyncio.get_running_loop()
+            future = self._futures[key] = loop.create_future()
+            future.add_done_callback(lambda _: self._futures.pop(key, None))
+            pending = self._pending.setdefault(preferred_service, [])
+            pending.append((normalized_message, future))
+
+            if len(pending) >= self.max_batch or (len(pending) == 1 and not self._in_flight.get(preferred_service)):
+                self._flush(preferred_service)
+            elif len(pending) == 1:
+                loop.call_later(self.window, self._flush, preferred_service)
+        return await asyncio.shield(future)
+
+    def _flush(self, preferred_service: str):
+        batch = self._pending.pop(preferred_service, None)
+        if batch:
+            self._in_flight[preferred_service] = self._in_flight.get(preferred_service, 0) + 1
+            task = asyncio.get_running_loop().create_task(self._classify_batch(batch, preferred_service))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _classify_batch(self, batch: list, preferred_service: str):
+        intents = [None] * len(batch)
+        try:
+            intents = await self._request_intents([message for message, _ in batch], preferred_service)
+        except Exception as e:
+            log.warning("[Agent Router] Classification failed: %s", e)
+        finally:
+            # Also runs if the task is cancelled, so no waiter is left on a future that never resolves.
+            self._in_flight[preferred_service] -= 1
+            batched = len(batch) > 1
+            for (_, future), intent in zip(batch, intents):
+                if not future.done():
+                    future.set_result((intent, batched))
+
+    @staticmethod
+    async def _request_intents(messages: list, preferred_service: str) -> list:
+        if len(messages) == 1:
+            prompt = [{"role": "system", "content": ROUTER_SYSTEM_PROMPT}, {"role": "user", "content": messages[0]}]
+        else:
+            numbered = "\n".join(f"{number}. {message}" for number, message in enumerate(messages, start=1))
+            prompt = [{"role": "system", "content": ROUTER_BATCH_SYSTEM_PROMPT}, {"role": "user", "content": numbered}]
+
+        # We call the LLM without any tools for this classification step.
+        # We use a low temperature for a more predictable classification.
+        response = await get_llm_response_async(prompt, preferred_service=preferred_service, temperature=0)
+        if not response or "choices" not in response or not response["choices"]:
+            return [None] * len(messages)
+
+        content = response["choices"][0]["message"]["content"]
+        log.debug("[Agent Router] Intent classified as: '%s'", content)
+        if len(messages) == 1:
+            return [_parse_intent(content)]
+
+        intents = [None] * len(messages)
+        for number, intent in BATCH_INTENT_LINE.findall(content):
+            index = int(number) - 1
+            if 0 <= index < len(intents):
+                intents[index] = intent.lower()
+        # A query the model skipped is treated as an unclear classification.
+        return [intent or "conversation" for intent in intents]
+
+
+_INTENT_BATCHER = None
+_INTENT_BATCHER_LOOP = None
+
+# LRU cache of normalized message + service -> intent, so repeated queries skip the router entirely.
+_INTENT_CACHE = OrderedDict()
+_INTENT_CACHE_SIZE = 1024
+_INTENT_CACHE_LOCK = threading.Lock()
+
+
+def _get_intent_batcher() -> _IntentBatcher:
+    """Returns the batcher of the running event loop, creating it on first use."""
+    global _INTENT_BATCHER, _INTENT_BATCHER_LOOP
+    loop = asyncio.get_running_loop()
+    if _INTENT_BATCHER is None or _INTENT_BATCHER_LOOP is not loop:
+        _INTENT_BATCHER = _IntentBatcher()
+        _INTENT_BATCHER_LOOP = loop
+    return _INTENT_BATCHER
+
+
+async def _get_intent(user_message: str, preferred_service: str) -> str:
     """
     Step 1: The Router.
     This function classifies the user's intent as either 'tool_use' or 'conversation'.
     """
-    print("[Agent Router] Step 1: Classifying intent...")
+    log.debug("[Agent Router] Step 1: Classifying intent...")
 
-    # A simple prompt to classify the intent.
-    system_prompt = """
-    You are an intent classification system. Your job is to determine if a user's query requires calling a tool or if it's a general conversational query.
-    The user has access to tools for controlling home devices and getting information like weather, time, or news.
+    if TOOL_COMMAND.search(user_message):
+        log.debug("[Agent Router] Intent classified locally as: 'tool_use'")
+        return "tool_use"
 
-    - If the query is a command, a request for specific data, or implies an action the tools can perform, respond with the single word: 'tool_use'.
-    - If the query is a simple greeting, a question about your identity or capabilities ('who are you'), or general small talk, respond with the single word: 'conversation'.
+    # Queries that only differ in case or whitespace share the same cache entry.
+    key = (WHITESPACE.sub(" ", user_message.strip().lower()), preferred_service)
+    with _INTENT_CACHE_LOCK:
+        intent = _INTENT_CACHE.get(key)
+        if intent:
+            _INTENT_CACHE.move_to_end(key)
+            return intent
 
-    Analyze the user query and provide your classification.
-    """
+    intent, batched = await _get_intent_batcher().classify(*key)
+    if intent is None:
+        # The LLM call failed; this is not cached so the next attempt asks again.
+        return "conversation"
+    if batched:
+        # Other users' queries shared the prompt and may have swayed the answer, so it isn't cached for everyone.
+        return intent
 
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_message}
-    ]
+    with _INTENT_CACHE_LOCK:
+        _INTENT_CACHE[key] = intent
+        if len(_INTENT_CACHE) > _INTENT_CACHE_SIZE:
+            _INTENT_CACHE.popitem(last=False)
+    return intent
 
-    # We call the LLM without any tools for this classification step.
-    # We use a low temperature for a more predictable classification.
-    response = get_llm_response(messages, preferred_service=preferred_service, temperature=0)
 
-    if response and "choices" in response and response["choices"]:
-        intent = response["choices"][0]["message"]["content"].strip().lower()
-        print(f"[Agent Router] Intent classified as: '{intent}'")
-        if "tool_use" in intent:
-            return "tool_use"
-    # Default to conversation if classification is unclear
-    return "conversation"
+def _iter_json_objects(text: str):
+    """
+    Yields every JSON object in `text` that starts with a "name" key, i.e. everything that looks like a tool call.
+    Each object is decoded in place with the shared decoder's raw_decode, which also reports where the object ends,
+    so nested arguments are handled and the text is scanned once without any regex backtracking.
+    """
+    position = 0
+    while True:
+        match = TOOL_OBJECT.search(text, position)
+        if not match:
+            return
+        try:
+            tool_call, position = JSON_DECODER.raw_decode(text, match.start())
+        except json.JSONDecodeError:
+            position = match.start() + 1
+            continue
+        yield tool_call
 
 
 def parse_tool_calls_from_content(content: str) -> list:
     """
     Parses tool call JSON from a markdown code block in the LLM's text response.
     This is a fallback for when the API doesn't use the native tool_calls feature correctly.
+    A malformed JSON block, or a malformed reply that is JSON on its own, is repaired with json_repair when it
+    is installed; otherwise, or if that fails, the individual tool call objects are scanned out of the text.
     """
-    json_match = re.search(r"```json\s*(.*?)\s*```", content, re.DOTALL)
-    if not json_match:
-        return None
+    json_match = JSON_FENCE.search(content)
+    json_string = json_match.group(1) if json_match else content
 
-    json_string = json_match.group(1)
     try:
         # The LLM might return a single JSON object or a list of them
-        data = json.loads(json_string)
+        data = _json_loads(json_string)
         if isinstance(data, list):
             # If it's a list, assume it's a list of tool calls and return it
             return data
@@ -74,70 +289,218 @@ def parse_tool_calls_from_content(content: str) -> list:
         else:
             return None
     except json.JSONDecodeError:
-        print(f"[Agent] Warning: Found a JSON block, but it was malformed: {json_string}")
+        # An unfenced reply is only repaired when it is JSON as a whole; prose around a call is left to the scanner.
+        if repair_json and (json_match or json_string.lstrip()[:1] in ("{", "[")):
+            # json_repair fixes trailing commas, missing quotes or brackets, ... in a single pass.
+            repaired = repair_json(json_string, return_objects=True)
+            if isinstance(repaired, dict):
+                return [repaired]
+            if isinstance(repaired, list) and repaired and all(isinstance(item, dict) for item in repaired):
+                return repaired
+
+        tool_calls = list(_iter_json_objects(json_string))
+        if tool_calls:
+            return tool_calls
+        if json_match:
+            log.warning("[Agent] Found a JSON block, but it was malformed: %s", json_string)
         return None
 
 
-def run_agent(user_message: str, preferred_service: str = "groq"):
+def _tool_calls_from_content(content: str) -> list:
+    """
+    Turns the tool calls a model wrote into its text reply, instead of using the native tool_calls feature,
+    into native tool calls so they are executed and summarized the same way. Objects without a name are dropped.
+    """
+    tool_calls = []
+    for call in parse_tool_calls_from_content(content) or []:
+        if not isinstance(call, dict) or not isinstance(call.get("name"), str):
+            continue
+        arguments = call.get("arguments") or {}
+        tool_calls.append({
+            "id": f"call_{len(tool_calls)}",
+            "type": "function",
+            "function": {"name": call["name"],
+                         "arguments": arguments if isinstance(arguments, str) else _json_dumps(arguments)},
+        })
+    return tool_calls
+
+
+def _parse_tool_arguments(function_name: str, raw_arguments):
+    """
+    Parses and validates the LLM's arguments for a tool with its Pydantic model.
+    Returns (function, arguments dict, None) on success or (None, None, error result) on failure.
+    """
+    entry = _TOOL_DISPATCH.get(function_name)
+    if entry is None:
+        return None, None, {"success": False, "error": f"Unknown function '{function_name}'"}
+
+    function_to_call, argument_model = entry
+    try:
+        if isinstance(raw_arguments, (str, bytes)):
+            arguments = argument_model.model_validate_json(raw_arguments or "{}")
+        else:
+            arguments = argument_model.model_validate(raw_arguments or {})
+    except ValidationError as e:
+        problems = "; ".join(f"{'.'.join(map(str, error['loc'])) or 'arguments'}: {error['msg']}" for error in e.errors())
+        return None, None, {"success": False, "error": f"Invalid arguments for '{function_name}': {problems}"}
+    return function_to_call, arguments.model_dump(), None
+
+
+async def _execute_tool_calls(tool_calls: list) -> list:
+    """
+    Executes the tool calls of one turn concurrently and returns their results in the emitted order.
+    Async tools (the HTTP data connectors) are awaited directly, while synchronous ones, like device control
+    over the serial port, run in the default executor. Device writes that target
+    the same device are chained together so they keep the order the model emitted them in.
+    Identical calls within the turn are only executed once and share their result.
+    """
+    loop = asyncio.get_running_loop()
+    results = [None] * len(tool_calls)
+    chains = {}
+    duplicates = []
+
+    for index, tool_call in enumerate(tool_calls):
+        function_name = tool_call["function"]["name"]
+        function_to_call, function_args, error = _parse_tool_arguments(function_name, tool_call["function"]["arguments"])
+        if error:
+            results[index] = error
+            continue
+
+        call_key = (function_name, _json_dumps(function_args, sort_keys=True))
+        if function_name in DEVICE_WRITE_TOOLS:
+            chain = chains.setdefault(("device", function_args["device_id"]), [])
+            # Repeating the previous write to the same device changes nothing. A repeat with another
+            # write in between (on, off, on) must still run, otherwise the device ends up in the wrong state.
+            if chain and chain[-1][0] == call_key:
+                duplicates.append((index, chain[-1][1]))
+                continue
+        else:
+            chain_key = ("call",) + call_key
+            if chain_key in chains:
+                duplicates.append((index, chains[chain_key][0][1]))
+                continue
+            chain = chains[chain_key] = []
+        chain.append((call_key, index, function_to_call, function_args))
+
+    async def run_chain(chain):
+        for _, index, function_to_call, function_args in chain:
+            if inspect.iscoroutinefunction(function_to_call):
+                results[index] = await function_to_call(**function_args)
+            else:
+                results[index] = await loop.run_in_executor(None, partial(function_to_call, **function_args))
+
+    # The tools report their own failures as error results, so an exception here is a bug in a tool.
+    # It stops the rest of its chain (later writes to that device) but not the other calls.
+    outcomes = await asyncio.gather(*(run_chain(chain) for chain in chains.values()), return_exceptions=True)
+    for chain, outcome in zip(chains.values(), outcomes):
+        if isinstance(outcome, Exception):
+            for _, index, _, _ in chain:
+                if results[index] is None:
+                    results[index] = {"success": False, "error": str(outcome)}
+
+    for index, original_index in duplicates:
+        results[index] = results[original_index]
+    return results
+
+
+async def _stream_or_fallback(chunks, fallback: str):
+    """Yields the streamed chunks, or the fallback message if the stream produced nothing (i.e. the call failed)."""
+    produced = False
+    async for chunk in chunks:
+        produced = True
+        yield chunk
+    if not produced:
+        yield fallback
+
+
+async def run_agent_stream(user_message: str, preferred_service: str = "groq", tools_used: list = None):
     """
     Runs the agent using the robust Router pattern with a final summarization instruction.
+    Tool calls of a single turn are executed concurrently, and the final answer is streamed:
+    this async generator yields its text chunks as soon as the LLM produces them.
+    If a tools_used list is given, the (name, validated arguments) of each tool call behind the answer are appended
+    to it, but only when every tool succeeded and the summary was generated, so an answer built on an error or a
+    fallback is never reported.
     """
-    print(f"\n[Agent] Received query: '{user_message}'")
-    print(f"[Agent] Using service provider: {preferred_service.upper()}")
+    log.debug("[Agent] Received query: '%s'", user_message)
+    log.debug("[Agent] Using service provider: %s", preferred_service)
 
-    intent = _get_intent(user_message, preferred_service)
+    intent = await _get_intent(user_message, preferred_service)
 
     if intent == "tool_use":
-        print("[Agent Executor] Intent is 'tool_use'. Proceeding with tool calling logic...")
-        system_prompt = "You are a smart home assistant. First, call the necessary tools to fulfill the user's request based on their query."
-        messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_message}]
-        tools_schema = get_tools_schema()
+        log.debug("[Agent Executor] Intent is 'tool_use'. Proceeding with tool calling logic...")
+        messages = [{"role": "system", "content": TOOL_USE_SYSTEM_PROMPT}, {"role": "user", "content": user_message}]
 
-        response = get_llm_response(messages, tools=tools_schema, preferred_service=preferred_service)
-        if not response or "choices" not in response or not response[
-            "choices"]: return "Error getting tool call decision."
+        response = await get_llm_response_async(messages, tools=TOOLS_SCHEMA, preferred_service=preferred_service)
+        if not response or "choices" not in response or not response["choices"]:
+            yield "Error getting tool call decision."
+            return
 
         response_message = response["choices"][0]["message"]
-        if not response_message.get(
-            "tool_calls"): return "I understand you want me to perform an action, but I couldn't determine which tool to use. Please rephrase."
-
         tool_calls = response_message.get("tool_calls")
+        if not tool_calls and response_message.get("content"):
+            tool_calls = _tool_calls_from_content(response_message["content"])
+            if tool_calls:
+                log.debug("[Agent Executor] Using %d tool call(s) parsed from the reply text.", len(tool_calls))
+                response_message = {"role": "assistant", "content": None, "tool_calls": tool_calls}
+        if not tool_calls:
+            yield "I understand you want me to perform an action, but I couldn't determine which tool to use. Please rephrase."
+            return
+
         messages.append(response_message)
 
-        for tool_call in tool_calls:
-            function_name, function_args = tool_call["function"]["name"], json.loads(tool_call["function"]["arguments"])
-            function_to_call = AVAILABLE_FUNCTIONS.get(function_name)
-            if function_to_call:
-                result = function_to_call(**function_args)
-                messages.append({"role": "tool", "tool_call_id": tool_call['id'], "name": function_name,
-                                 "content": json.dumps(result)})
+        results = await _execute_tool_calls(tool_calls)
+        for tool_call, result in zip(tool_calls, results):
+            messages.append({"role": "tool", "tool_call_id": tool_call['id'], "name": tool_call["function"]["name"],
+                             "content": _json_dumps(result)})
 
         # <<< بخش کلیدی جدید: افزودن دستورالعمل نهایی برای تولید خلاصه >>>
-        print("[Agent Summarizer] Adding final instruction for a comprehensive response...")
-        final_instruction = """
-        You have successfully executed all required tools and their results have been provided.
-        Now, formulate a single, cohesive, natural-language response to the user.
-        Your response MUST address all parts of the user's original query, including both confirming the actions you took AND answering any conversational questions.
-        Synthesize all information into a friendly and complete answer.
-        """
-        messages.append({"role": "user", "content": final_instruction})
+        log.debug("[Agent Summarizer] Adding final instruction for a comprehensive response...")
+        messages.append({"role": "user", "content": SUMMARY_INSTRUCTION})
 
         # --- فراخوانی نهایی برای تولید خلاصه ---
-        print("[Agent Summarizer] Generating final response...")
-        final_response = get_llm_response(messages, preferred_service=preferred_service)  # No tools are passed here
-        if not final_response or "choices" not in final_response or not final_response[
-            "choices"]: return "Tasks executed, but summary failed."
-        return final_response["choices"][0]["message"]["content"]
+        log.debug("[Agent Summarizer] Generating final response...")
+        # The same tools are sent again, but disabled, so the system prompt + tools + user query prefix is byte-identical
+        # to the previous call and the provider's prompt-prefix cache can be reused.
+        summarized = False
+        async for chunk in stream_llm_response_async(messages, tools=TOOLS_SCHEMA, preferred_service=preferred_service,
+                                                     tool_choice="none"):
+            summarized = True
+            yield chunk
+        if not summarized:
+            yield "Tasks executed, but summary failed."
+        elif tools_used is not None and all(result.get("success") for result in results):
+            for tool_call in tool_calls:
+                function_name = tool_call["function"]["name"]
+                _, function_args, _ = _parse_tool_arguments(function_name, tool_call["function"]["arguments"])
+                tools_used.append((function_name, function_args))
 
     else:  # intent == "conversation"
-        print("[Agent Executor] Intent is 'conversation'. Proceeding with conversational logic...")
-        system_prompt = "You are a friendly and helpful smart home assistant. Keep your answers concise and polite."
-        messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_message}]
+        log.debug("[Agent Executor] Intent is 'conversation'. Proceeding with conversational logic...")
+        messages = [{"role": "system", "content": CONVERSATION_SYSTEM_PROMPT}, {"role": "user", "content": user_message}]
+
+        chunks = stream_llm_response_async(messages, preferred_service=preferred_service)
+        async for chunk in _stream_or_fallback(chunks, "I'm having trouble thinking of a response right now."):
+            yield chunk
 
-        response = get_llm_response(messages, preferred_service=preferred_service)
-        if not response or "choices" not in response or not response[
-            "choices"]: return "I'm having trouble thinking of a response right now."
-        return response["choices"][0]["message"]["content"]
+
+async def run_agent_async(user_message: str, preferred_service: str = "groq", tools_used: list = None) -> str:
+    """Runs the agent and returns the complete final answer as a single string."""
+    return "".join([chunk async for chunk in run_agent_stream(user_message, preferred_service, tools_used)])
+
+
+def run_agent(user_message: str, preferred_service: str = "groq") -> str:
+    """
+    Synchronous wrapper around run_agent_async for callers without an event loop.
+    The shared HTTP client is bound to the loop asyncio.run creates, so it is closed before that loop goes away.
+    """
+    async def run_and_close():
+        try:
+            return await run_agent_async(user_message, preferred_service)
+        finally:
+            await close_async_client()
+
+    return asyncio.run(run_and_close())
 
 
 # def run_agent(user_message: str, preferred_service: str = "groq"):  # I've set groq as default as it's often more stable
@@ -223,17 +586,24 @@ def run_agent(user_message: str, preferred_service: str = "groq"):
 
 if __name__ == "__main__":
     print("--- Starting Agent Test ---")
-    print("--- Starting Agent Test ---")
-    # response1 = run_agent("Turn on the lamp in room 1")
-    # response1 = run_agent("Turn on all ac units")
-    # response1 = run_agent("Hello how are you?")
-    # response1 = run_agent("What is today's date?")
-    response1 = run_agent("turn on all lamps and who are you?")
-    # response1 = run_agent("What is the weather like in Isfahan?")
-    # response1 = run_agent("Turn on the light in room 1 and tell me the weather in Tehran and what time is it?")
-    # response1 = run_agent("I want to sleep.")
-    # response1 = run_agent("I want to sleep. I need a dark and quiet environment.")
-    # response1 = run_agent("Tell me some news from china.")
-    # response1 = run_agent("I want see football on tv")
-    # response1 = run_agent("What is today's date?")
-    print("\n--- Final Response 1 ---\n", response1)
\ No newline at end of file
+    log.setLevel(logging.DEBUG)
+    # query = "Turn on the lamp in room 1"
+    # query = "Turn on all ac units"
+    # query = "Hello how are you?"
+    # query = "What is today's date?"
+    query = "turn on all lamps and who are you?"
+    # query = "What is the weather like in Isfahan?"
+    # query = "Turn on the light in room 1 and tell me the weather in Tehran and what time is it?"
+    # query = "I want to sleep."
+    # query = "I want to sleep. I need a dark and quiet environment."
+    # query = "Tell me some news from china."
+    # query = "I want see football on tv"
+    # query = "What is today's date?"
+
+    async def print_streamed_response(user_message: str):
+        print("\n--- Final Response 1 ---")
+        async for chunk in run_agent_stream(user_message):
+            print(chunk, end="", flush=True)
+        print()
+
+    asyncio.run(print_streamed_response(query))
\ No newline at end of file
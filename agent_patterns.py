@@ -0,0 +1,28 @@
+# agent_patterns.py
+# Regular expressions and the JSON decoder shared by the agent. They are compiled once at import
+# time and are safe to share between threads and requests.
+
+import json
+import re
+
+WHITESPACE = re.compile(r"\s+")
+
+# A ```json markdown block in an LLM reply.
+JSON_FENCE = re.compile(r"```json\s*(.*?)\s*```", re.DOTALL)
+
+# The start of a JSON object whose first key is "name", i.e. something that looks like a tool call.
+TOOL_OBJECT = re.compile(r'\{\s*"name"\s*:')
+
+# Imperative commands that unambiguously ask for one of the tools; such queries skip the LLM router.
+# Only command shapes are matched ("turn on the lamp", "switch the tv off", "weather in Tehran"): bare nouns
+# like "time" or "news" also appear in small talk, so those queries are left to the router.
+TOOL_COMMAND = re.compile(r"^\s*(?:please\s+)?(?:turn|switch)\s+(?:on|off)\b"
+                          r"|^\s*(?:please\s+)?(?:turn|switch)\s+(?:the\s+)?\w+(?:\s+\w+){0,2}\s+(?:on|off)\b"
+                          r"|\bweather\s+(?:in|for)\s+\w",
+                          re.IGNORECASE)
+
+# One "<number>. <intent>" line of a batched router answer.
+BATCH_INTENT_LINE = re.compile(r"^\s*(\d+)\s*[.):-]\s*'?(tool_use|conversation)", re.IGNORECASE | re.MULTILINE)
+
+# raw_decode parses one JSON value starting at a given index and reports where it ended.
+JSON_DECODER = json.JSONDecoder()
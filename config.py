@@ -0,0 +1,21 @@
+# config.py
+# Loads the .env file once and exposes the settings every other module reads. Modules import the
+# constants from here instead of calling load_dotenv themselves, so the file is parsed a single time
+# regardless of import order.
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# LLM providers (llm_client.py). A service whose key is missing is left out of the failover rotation.
+TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+
+# Data APIs (data_connectors.py). The connectors return an error result when their key is missing.
+OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
+NEWS_API_KEY = os.getenv("NEWS_API_KEY")
+
+# API server (main_api.py). Each worker is a separate process with its own serial-port handle, LLM clients and
+# caches; the device bus can only be opened by one process, so more than one worker is only safe without hardware.
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
@@ -1,22 +1,82 @@
 # data_connectors.py (Updated to return structured data)
-import requests
+import asyncio
 import datetime
-import os
-from dotenv import load_dotenv
+import inspect
+import threading
+import time
+from functools import wraps
+from config import NEWS_API_KEY, OPENWEATHER_API_KEY
+from http_client import get_async_client
+from json_utils import json_loads
 
-load_dotenv()
-OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
-NEWS_API_KEY = os.getenv("NEWS_API_KEY")
 
-def get_current_weather(city: str = "Tehran", unit: str = "metric"):
+def _ttl_cache(ttl: float, maxsize: int = 64):
+    """
+    Decorator that reuses a connector's successful results for `ttl` seconds, keyed on the call arguments.
+    Errors (missing API key, network failure, ...) are never cached. Works for both sync and async functions.
+    The wrapper's `cache_remaining(*args, **kwargs)` returns how many seconds the cached result for those arguments
+    stays fresh (0 if there is none), so callers can tell how long an answer built on it remains valid.
+    """
+    def decorator(function):
+        cache = {}
+        lock = threading.Lock()
+
+        def lookup(key, now):
+            entry = cache.get(key)
+            return entry[1] if entry and entry[0] > now else None
+
+        def store(key, now, result):
+            if result.get("success"):
+                with lock:
+                    if len(cache) >= maxsize:
+                        for stale_key in [k for k, (expiry, _) in cache.items() if expiry <= now]:
+                            del cache[stale_key]
+                    if len(cache) >= maxsize:
+                        cache.pop(next(iter(cache)))
+                    cache[key] = (now + ttl, result)
+
+        def cache_remaining(*args, **kwargs):
+            entry = cache.get((args, frozenset(kwargs.items())))
+            return max(entry[0] - time.monotonic(), 0) if entry else 0
+
+        if inspect.iscoroutinefunction(function):
+            @wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                key, now = (args, frozenset(kwargs.items())), time.monotonic()
+                result = lookup(key, now)
+                if result is None:
+                    result = await function(*args, **kwargs)
+                    store(key, now, result)
+                return result
+
+            async_wrapper.cache_remaining = cache_remaining
+            return async_wrapper
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            key, now = (args, frozenset(kwargs.items())), time.monotonic()
+            result = lookup(key, now)
+            if result is None:
+                result = function(*args, **kwargs)
+                store(key, now, result)
+            return result
+
+        wrapper.cache_remaining = cache_remaining
+        return wrapper
+
+    return decorator
+
+
+@_ttl_cache(ttl=300)
+async def get_current_weather(city: str = "Tehran", unit: str = "metric"):
     print(f"call get_current_weather api ...")
     if not OPENWEATHER_API_KEY: return {"success": False, "error": "Weather API Key not set."}
     base_url = "http://api.openweathermap.org/data/2.5/weather"
     params = {"q": city, "appid": OPENWEATHER_API_KEY, "units": unit, "lang": "en"}
     try:
-        response = requests.get(base_url, params=params)
+        response = await get_async_client().get(base_url, params=params)
         response.raise_for_status()
-        data = response.json()
+        data = json_loads(response.content)
         if data.get("cod") != 200: return {"success": False, "error": data.get('message')}
 
         return {
@@ -30,38 +90,50 @@ def get_current_weather(city: str = "Tehran", unit: str = "metric"):
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+_DAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+_MONTH_NAMES = ("January", "February", "March", "April", "May", "June", "July", "August", "September", "October",
+                "November", "December")
+
+@_ttl_cache(ttl=1)
 def get_current_time():
     print(f"call get_current_time api ...")
-    now = datetime.datetime.now()
-    return {"success": True, "time": now.strftime('%H:%M:%S')}
+    # time.strftime on a struct_time skips building a datetime object.
+    return {"success": True, "time": time.strftime('%H:%M:%S')}
 
+@_ttl_cache(ttl=60)
 def get_current_date():
     print(f"call get_current_date api ...")
-    today = datetime.datetime.now()
+    today = datetime.date.today()
+    # Names are looked up by index instead of formatting the date with strftime three times.
+    day_name = _DAY_NAMES[today.weekday()]
+    month_name = _MONTH_NAMES[today.month - 1]
     return {
         "success": True,
-        "fullDate": today.strftime('%A, %B %d, %Y'),
-        "dayOfWeek": today.strftime('%A'),
-        "month": today.strftime('%B'),
+        "fullDate": f"{day_name}, {month_name} {today.day:02d}, {today.year}",
+        "dayOfWeek": day_name,
+        "month": month_name,
         "day": today.day,
         "year": today.year,
     }
 
-def get_news_headlines(category: str = "general", country: str = "us"):
+@_ttl_cache(ttl=900)
+async def get_news_headlines(category: str = "general", country: str = "us"):
     print(f"call get_news_headlines api ...")
     if not NEWS_API_KEY: return {"success": False, "error": "News API Key not set."}
     base_url = "https://newsapi.org/v2/top-headlines"
     params = {"apiKey": NEWS_API_KEY, "category": category, "country": country, "pageSize": 3}
     try:
-        response = requests.get(base_url, params=params)
+        response = await get_async_client().get(base_url, params=params)
         response.raise_for_status()
-        data = response.json()
-        articles = data.get("articles", [])
+        data = json_loads(response.content)
+        # Sliced so the work stays bounded even if the API ignores pageSize.
+        articles = data.get("articles", ())[:3]
         if not articles: return {"success": False, "error": f"No news found."}
 
+        # A tuple, as the result is shared by every caller while it sits in the TTL cache.
         return {
             "success": True,
-            "headlines": [article['title'] for article in articles]
+            "headlines": tuple(article['title'] for article in articles)
         }
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -70,7 +142,7 @@ def get_news_headlines(category: str = "general", country: str = "us"):
 if __name__ == "__main__":
     # Test data connectors
     print("Testing data connectors...")
-    print(get_current_weather("Tehran"))
+    print(asyncio.run(get_current_weather("Tehran")))
     print(get_current_time())
     print(get_current_date())
-    print(get_news_headlines())
\ No newline at end of file
+    print(asyncio.run(get_news_headlines()))
\ No newline at end of file
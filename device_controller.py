@@ -19,12 +19,19 @@ DEVICE_MAP = {
     "living_room_tv": {"slave_id": 0x37, "register": 3, "name": "Living Room TV"},
 }
 
+# Every device only ever receives ON_VALUE or OFF_VALUE, so its complete frames (CRC included) are built once.
+_DEVICE_FRAMES = {
+    (device_id, value): generate_write_command(info["slave_id"], info["register"], value)
+    for device_id, info in DEVICE_MAP.items()
+    for value in (ON_VALUE, OFF_VALUE)
+}
+
 def _control_device(device_id: str, value: int, action_name: str):
-    if device_id not in DEVICE_MAP:
+    device_info = DEVICE_MAP.get(device_id)
+    if device_info is None:
         return {"success": False, "error": f"Device '{device_id}' not found."}
 
-    device_info = DEVICE_MAP[device_id]
-    command = generate_write_command(device_info["slave_id"], device_info["register"], value)
+    command = _DEVICE_FRAMES[(device_id, value)]
 
     if send_modbus_command(command):
         print(f"Action: {device_info['name']} was {action_name}.")
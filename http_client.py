@@ -0,0 +1,35 @@
+# http_client.py
+# The single httpx.AsyncClient shared by the LLM client and the data connectors.
+
+import asyncio
+import logging
+import httpx
+
+# httpx logs every request at INFO level, which would flood the log configured in modbus_utils.
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# Every async call in the application shares one pooled HTTP/2 client, so concurrent requests to the same
+# host are multiplexed over one kept-alive TLS connection instead of paying a handshake per call.
+# Connections are bound to the event loop that opened them, so a new client is created if the loop changes
+# (e.g. between two asyncio.run calls).
+_CLIENT = None
+_CLIENT_LOOP = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Returns the shared async client of the running event loop, creating it on first use."""
+    global _CLIENT, _CLIENT_LOOP
+    loop = asyncio.get_running_loop()
+    if _CLIENT is None or _CLIENT_LOOP is not loop:
+        _CLIENT = httpx.AsyncClient(http2=True, timeout=30.0,
+                                    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64))
+        _CLIENT_LOOP = loop
+    return _CLIENT
+
+
+async def close_async_client():
+    """Closes the shared async client, e.g. when the application shuts down."""
+    global _CLIENT, _CLIENT_LOOP
+    if _CLIENT is not None:
+        await _CLIENT.aclose()
+    _CLIENT = _CLIENT_LOOP = None
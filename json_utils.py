@@ -0,0 +1,29 @@
+# json_utils.py
+# JSON encoding and decoding shared by the agent, the LLM client and the data connectors.
+# orjson is used when it is installed; otherwise the standard library gives the same results, only slower.
+
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the standard library is used when it isn't installed.
+    orjson = None
+
+
+def json_loads(data):
+    """Parses JSON from str or bytes. orjson's JSONDecodeError subclasses json.JSONDecodeError."""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def json_dumps(obj, sort_keys: bool = False) -> str:
+    """Serializes to a JSON string."""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else None).decode()
+    return json.dumps(obj, sort_keys=sort_keys)
+
+
+def json_dumps_bytes(obj) -> bytes:
+    """Serializes to UTF-8 JSON bytes, ready to be sent as an HTTP request body."""
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
@@ -1,62 +1,217 @@
 # llm_client.py (Final Corrected Version)
 
-import os
-import requests
-import json
-from dotenv import load_dotenv
+import asyncio
+import httpx
+from config import GROQ_API_KEY, TOGETHER_API_KEY
+from http_client import get_async_client
+from json_utils import json_dumps_bytes, json_loads
 
-load_dotenv()
 
-TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Transient failures (rate limiting, 5xx, dropped connections) are retried with exponential backoff
+# (0.3s, 0.6s, 1.2s) before a call gives up. The final error response is returned rather than raised,
+# so its body can still be reported.
+_RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+_RETRIES = 3
+_BACKOFF_FACTOR = 0.3
+
+# Marks the end of a server-sent event stream.
+_SSE_DONE = object()
+
+
+# Endpoint and model of every supported service: name -> (api_key, url, model).
+_SERVICE_ENDPOINTS = {
+    "togetherai": (TOGETHER_API_KEY, "https://api.together.xyz/v1/chat/completions",
+                   "meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo"),  # The model you confirmed works well
+    "groq": (GROQ_API_KEY, "https://api.groq.com/openai/v1/chat/completions",
+             "llama3-70b-8192"),  # Groq works well with the 70B model
+}
+
+# Request settings of the services that have an API key, built once so a call is a single dict lookup.
+_SERVICES = {
+    name: {
+        "url": url,
+        "model": model,
+        "headers": {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        },
+    }
+    for name, (api_key, url, model) in _SERVICE_ENDPOINTS.items()
+    if api_key
+}
+
+
+def _failover_service(preferred_service: str):
+    """Returns another configured service to try when preferred_service fails, or None if there is none."""
+    return next((name for name in _SERVICES if name != preferred_service), None)
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Delay before retry number attempt + 1."""
+    return _BACKOFF_FACTOR * (2 ** attempt)
+
+
+# Serialized request settings that come before "messages" in the body, keyed on everything they contain.
+# The tools schema is several KB of JSON (mostly the NewsArgs country enum) and identical on every turn, so it
+# is serialized once instead of per call. Entries keep a reference to their tools object so its id can't be reused.
+_PAYLOAD_PREFIXES = {}
+_PAYLOAD_PREFIXES_MAX = 32
+
+
+def _payload_prefix(model: str, tools, temperature: float, tool_choice: str, stream: bool) -> bytes:
+    """Returns the JSON body up to and including '"messages":'; tools must not be mutated after being passed here."""
+    key = (model, id(tools), temperature, tool_choice, stream)
+    entry = _PAYLOAD_PREFIXES.get(key)
+    if entry is not None and entry[0] is tools:
+        return entry[1]
+
+    payload = {
+        "model": model,
+        "temperature": temperature, # Now uses the temperature passed to the function
+        "max_tokens": 1024,
+    }
+    if tools:
+        payload["tools"] = tools
+        payload["tool_choice"] = tool_choice
+    if stream:
+        payload["stream"] = True
+    prefix = json_dumps_bytes(payload)[:-1] + b',"messages":'
+
+    if len(_PAYLOAD_PREFIXES) >= _PAYLOAD_PREFIXES_MAX:
+        _PAYLOAD_PREFIXES.clear()
+    _PAYLOAD_PREFIXES[key] = (tools, prefix)
+    return prefix
+
+
+def _build_request(messages: list, tools: list, preferred_service: str, temperature: float, tool_choice: str,
+                   stream: bool = False):
+    """Returns the (url, headers, body) of a chat completion request for the given service."""
+    cfg = _SERVICES.get(preferred_service)
+    if cfg is None:
+        if preferred_service in _SERVICE_ENDPOINTS:
+            raise ValueError(f"API Key for '{preferred_service}' not set in .env file.")
+        raise ValueError("Invalid preferred_service. Must be 'groq' or 'togetherai'.")
+
+    # Only the messages change between turns; they are appended to the cached serialized prefix.
+    body = _payload_prefix(cfg["model"], tools, temperature, tool_choice, stream) + json_dumps_bytes(messages) + b"}"
+    return cfg["url"], cfg["headers"], body
+
+
+def _parse_sse_line(line: str):
+    """
+    Returns the delta text of one server-sent event line, None if it carries no text, or _SSE_DONE at the end.
+    A data line that isn't valid JSON is skipped rather than ending the stream.
+    """
+    if not line or not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return _SSE_DONE
+    try:
+        event = json_loads(data)
+    except ValueError:
+        print(f"Skipping malformed stream event: {data[:200]}")
+        return None
+    choices = event.get("choices") if isinstance(event, dict) else None
+    if not choices:
+        return None
+    return choices[0].get("delta", {}).get("content")
+
+
+async def _send_with_retries(request: httpx.Request, stream: bool = False) -> httpx.Response:
+    """
+    Sends a request over the shared async client, retrying transient failures with backoff.
+    Returns the last response, which may still be an error status; raises the last transport error.
+    """
+    client = get_async_client()
+    for attempt in range(_RETRIES + 1):
+        last_attempt = attempt == _RETRIES
+        try:
+            response = await client.send(request, stream=stream)
+        except httpx.TransportError:
+            if last_attempt:
+                raise
+        else:
+            if last_attempt or response.status_code not in _RETRY_STATUSES:
+                return response
+            await response.aclose()
+        await asyncio.sleep(_backoff_delay(attempt))
+
 
 # <<< KEY CHANGE IS IN THIS FUNCTION DEFINITION >>>
-def get_llm_response(messages: list, tools: list = None, preferred_service: str = "togetherai", temperature: float = 0.7):
+async def get_llm_response_async(messages: list, tools: list = None, preferred_service: str = "togetherai",
+                                 temperature: float = 0.7, tool_choice: str = "auto", failover: bool = True):
     """
     Calls an LLM API using an OpenAI-compatible interface, supporting tool calls and temperature setting.
+    The request is sent over the shared pooled HTTP/2 client.
     Args:
         messages: A list of message objects.
         tools: An optional list of tool schemas.
         preferred_service: The API service to use ('togetherai' or 'groq').
         temperature: The sampling temperature for the model.
+        tool_choice: How the model may use the tools ('auto', 'required' or 'none'). Only sent when tools are given.
+        failover: Whether to retry the call on the other configured service once the retries are exhausted.
     Returns:
         The full JSON response from the API as a dictionary, or None on failure.
     """
-    if preferred_service == "togetherai":
-        api_key = TOGETHER_API_KEY
-        url = "https://api.together.xyz/v1/chat/completions"
-        model = "meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo" # The model you confirmed works well
-    elif preferred_service == "groq":
-        api_key = GROQ_API_KEY
-        url = "https://api.groq.com/openai/v1/chat/completions"
-        model = "llama3-70b-8192" # Groq works well with the 70B model
-    else:
-        raise ValueError("Invalid preferred_service. Must be 'groq' or 'togetherai'.")
+    url, headers, body = _build_request(messages, tools, preferred_service, temperature, tool_choice)
+    request = get_async_client().build_request("POST", url, headers=headers, content=body)
 
-    if not api_key:
-        raise ValueError(f"API Key for '{preferred_service}' not set in .env file.")
+    try:
+        response = await _send_with_retries(request)
+        response.raise_for_status()
+        return json_loads(response.content)
+    except httpx.HTTPError as e:
+        print(f"Error calling {preferred_service} API: {e}")
+        if isinstance(e, httpx.HTTPStatusError):
+            print(f"Response body: {e.response.text}")
+    except ValueError as e:  # A 2xx reply whose body isn't JSON (e.g. a proxy error page)
+        print(f"Invalid JSON from {preferred_service} API: {e}")
+        print(f"Response body: {response.text[:500]}")
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+    fallback = _failover_service(preferred_service) if failover else None
+    if fallback:
+        print(f"Failing over to {fallback}.")
+        return await get_llm_response_async(messages, tools, fallback, temperature, tool_choice, failover=False)
+    return None
 
-    payload = {
-        "model": model,
-        "messages": messages,
-        "temperature": temperature, # Now uses the temperature passed to the function
-        "max_tokens": 1024,
-    }
-    if tools:
-        payload["tools"] = tools
-        payload["tool_choice"] = "auto"
+
+async def stream_llm_response_async(messages: list, tools: list = None, preferred_service: str = "togetherai",
+                                    temperature: float = 0.7, tool_choice: str = "auto", failover: bool = True):
+    """
+    Same as get_llm_response_async, but streams the completion as server-sent events.
+    The call only fails over to the other service if it failed before any text was yielded.
+    Yields:
+        The text content of each delta as soon as it arrives. Nothing is yielded on failure.
+    """
+    url, headers, body = _build_request(messages, tools, preferred_service, temperature, tool_choice, stream=True)
+    request = get_async_client().build_request("POST", url, headers=headers, content=body)
+    yielded = False
 
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        response = await _send_with_retries(request, stream=True)
+        try:
+            if response.is_error:
+                await response.aread()
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                content = _parse_sse_line(line)
+                if content is _SSE_DONE:
+                    break
+                if content:
+                    yielded = True
+                    yield content
+            return
+        finally:
+            await response.aclose()
+    except httpx.HTTPError as e:
         print(f"Error calling {preferred_service} API: {e}")
-        if e.response:
-             print(f"Response body: {e.response.text}")
-        return None
\ No newline at end of file
+        if isinstance(e, httpx.HTTPStatusError):
+            print(f"Response body: {e.response.text}")
+
+    fallback = _failover_service(preferred_service) if failover and not yielded else None
+    if fallback:
+        print(f"Failing over to {fallback}.")
+        async for content in stream_llm_response_async(messages, tools, fallback, temperature, tool_choice,
+                                                       failover=False):
+            yield content
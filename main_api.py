@@ -1,10 +1,24 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from agent import run_agent
+from fastapi.responses import StreamingResponse
+from agent import AVAILABLE_FUNCTIONS, run_agent_async, run_agent_stream
+from config import API_WORKERS
+from http_client import close_async_client, get_async_client
+from json_utils import json_dumps, json_dumps_bytes
 import uvicorn
-from typing import List, Dict, Any
+from typing import Optional
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Opens the shared HTTP client (LLM + data APIs) on startup and closes its pooled connections on shutdown."""
+    get_async_client()
+    yield
+    await close_async_client()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,6 +29,65 @@ app.add_middleware(
 )
 
 
+def _fmt_weather(tool_result: dict) -> dict:
+    return {
+        "type": "weather",
+        "content": f"Current weather in {tool_result.get('city', 'your area')} is {tool_result.get('condition', 'unknown')}.",
+        "data": tool_result
+    }
+
+
+def _fmt_time(tool_result: dict) -> dict:
+    return {
+        "type": "time",
+        "content": f"The current time is {tool_result.get('time', 'unknown')}.",
+        "data": tool_result
+    }
+
+
+def _fmt_date(tool_result: dict) -> dict:
+    return {
+        "type": "date",
+        "content": f"Today is {tool_result.get('fullDate', 'unknown')}.",
+        "data": tool_result
+    }
+
+
+def _fmt_news(tool_result: dict) -> dict:
+    return {
+        "type": "news",
+        "content": "Here are today's top headlines for you.",
+        "data": tool_result
+    }
+
+
+def _fmt_device(tool_result: dict) -> dict:
+    return {
+        "type": "device",
+        "content": f"Alright, the {tool_result.get('deviceName')} was successfully {tool_result.get('action')}. ✨",
+        "data": None
+    }
+
+
+def _fmt_general(tool_result: dict) -> dict:
+    return {
+        "type": "general",
+        "content": "Your request has been processed successfully.",
+        "data": tool_result
+    }
+
+
+# Exact tool name -> formatter, so dispatch is one dict lookup and tool names can't overlap.
+_FORMATTERS = {
+    "call_get_current_weather": _fmt_weather,
+    "call_get_current_time": _fmt_time,
+    "call_get_current_date": _fmt_date,
+    "call_get_news_headlines": _fmt_news,
+    "call_turn_on_device": _fmt_device,
+    "call_turn_off_device": _fmt_device,
+}
+
+
 def _format_response(tool_call_name: str, tool_result: dict) -> dict:
     """Formats the raw tool result into the final JSON structure."""
 
@@ -25,45 +98,38 @@ def _format_response(tool_call_name: str, tool_result: dict) -> dict:
             "data": tool_result
         }
 
-    if "weather" in tool_call_name:
-        return {
-            "type": "weather",
-            "content": f"Current weather in {tool_result.get('city', 'your area')} is {tool_result.get('condition', 'unknown')}.",
-            "data": tool_result
-        }
-    elif "time" in tool_call_name:
-        return {
-            "type": "time",
-            "content": f"The current time is {tool_result.get('time', 'unknown')}.",
-            "data": tool_result
-        }
-    elif "date" in tool_call_name:
-        return {
-            "type": "date",
-            "content": f"Today is {tool_result.get('fullDate', 'unknown')}.",
-            "data": tool_result
-        }
-    elif "news" in tool_call_name:
-        return {
-            "type": "news",
-            "content": "Here are today's top headlines for you.",
-            "data": tool_result
-        }
-    elif "device" in tool_call_name:
-        return {
-            "type": "device",
-            "content": f"Alright, the {tool_result.get('deviceName')} was successfully {tool_result.get('action')}. ✨",
-            "data": None
-        }
-    else:
-        return {
-            "type": "general",
-            "content": "Your request has been processed successfully.",
-            "data": tool_result
-        }
+    return _FORMATTERS.get(tool_call_name, _fmt_general)(tool_result)
+
+
+def _cache_max_age(tools_used: list) -> Optional[int]:
+    """
+    Returns how many seconds an answer stays valid: the shortest time left before one of the cached tool results
+    behind it expires. None means it must not be cached: conversational answers, device actions, tools without
+    a cache and results that are about to expire.
+    """
+    if not tools_used:
+        return None
+    remaining = []
+    for name, arguments in tools_used:
+        cache_remaining = getattr(AVAILABLE_FUNCTIONS.get(name), "cache_remaining", None)
+        if cache_remaining is None:
+            return None
+        remaining.append(cache_remaining(**arguments))
+    return int(min(remaining)) or None
+
 
+def _cached_json_response(content: list, tools_used: list) -> Response:
+    """
+    Serializes the response once and, if it only depends on cached data, adds a Cache-Control max-age
+    matching the remaining lifetime of that data so the browser can reuse it.
+    """
+    body = json_dumps_bytes(content)
+    max_age = _cache_max_age(tools_used)
+    cache_control = "no-store" if max_age is None else f"private, max-age={max_age}"
+    return Response(body, media_type="application/json", headers={"Cache-Control": cache_control})
 
-@app.get("/data", response_model=List[Dict[str, Any]])
+
+@app.get("/data")
 async def handle_agent_query(userInput: str):
     """
     This API endpoint receives a user query, processes it with the agent,
@@ -72,7 +138,8 @@ async def handle_agent_query(userInput: str):
     if not userInput:
         raise HTTPException(status_code=400, detail="userInput parameter cannot be empty.")
 
-    agent_results = run_agent(userInput)
+    tools_used = []
+    agent_results = await run_agent_async(userInput, tools_used=tools_used)
 
     # --- KEY CHANGE STARTS HERE ---
 
@@ -84,15 +151,35 @@ async def handle_agent_query(userInput: str):
             formatted_response = _format_response(tool_name, tool_data)
             final_responses.append(formatted_response)
 
-        return final_responses
+        return _cached_json_response(final_responses, tools_used)
 
-    return [{
+    return _cached_json_response([{
         "type": "general",
         "content": agent_results,
         "data": None
-    }]
+    }], tools_used)
+
+
+@app.get("/data/stream")
+async def stream_agent_query(userInput: str):
+    """
+    Streams the agent's final answer as server-sent events while the LLM generates it.
+    Each event is `data: {"content": "<text chunk>"}`; the stream ends with `data: [DONE]`.
+    Tool calls are still collected and executed in full before the answer starts streaming.
+    """
+    if not userInput:
+        raise HTTPException(status_code=400, detail="userInput parameter cannot be empty.")
+
+    async def events():
+        async for chunk in run_agent_stream(userInput):
+            yield f"data: {json_dumps({'content': chunk})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
 if __name__ == "__main__":
     print("Starting FastAPI server at http://localhost:8090")
-    uvicorn.run(app, host="0.0.0.0", port=8090)
\ No newline at end of file
+    # loop/http "auto" use uvloop and httptools when they are installed and fall back to asyncio/h11 otherwise.
+    # The app is passed as an import string so uvicorn can spawn API_WORKERS worker processes.
+    uvicorn.run("main_api:app", host="0.0.0.0", port=8090, workers=API_WORKERS, loop="auto", http="auto")
\ No newline at end of file
@@ -1,6 +1,8 @@
 # modbus_utils.py
 
+import atexit
 import serial
+import threading
 import time
 import logging
 
@@ -14,16 +16,29 @@ TIMEOUT = 1
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def calculate_crc(data: bytes) -> bytes:
-    crc = 0xFFFF
-    for byte in data:
-        crc ^= byte
+def _build_crc_table() -> tuple:
+    """Precomputes the CRC-16/Modbus (polynomial 0xA001) remainder of every possible byte value."""
+    table = []
+    for byte in range(256):
+        crc = byte
         for _ in range(8):
             if crc & 0x0001:
                 crc >>= 1
                 crc ^= 0xA001
             else:
                 crc >>= 1
+        table.append(crc)
+    return tuple(table)
+
+
+_CRC_TABLE = _build_crc_table()
+
+
+def calculate_crc(data: bytes) -> bytes:
+    # One table lookup per byte instead of eight shift/xor steps.
+    crc = 0xFFFF
+    for byte in data:
+        crc = (crc >> 8) ^ _CRC_TABLE[(crc ^ byte) & 0xFF]
     return crc.to_bytes(2, byteorder='little')
 
 def generate_write_command(slave_id: int, register: int, value: int) -> bytes:
@@ -34,43 +49,72 @@ def generate_write_command(slave_id: int, register: int, value: int) -> bytes:
     # Register address starts from 0, so we subtract 1
     #register_address = register - 1
 
-    # [Slave ID] [Function Code] [Register Address High] [Register Address Low] [Value High] [Value Low]
-    command = bytearray()
-    command.append(slave_id)
-    command.append(function_code)
-    command.append(register >> 8)    # High byte of register
-    command.append(register & 0xFF) # Low byte of register
-    command.append(value >> 8)              # High byte of value
-    command.append(value & 0xFF)            # Low byte of value
-
-    crc = calculate_crc(command)
-    command.extend(crc)
+    # [Slave ID] [Function Code] [Register Address High] [Register Address Low] [Value High] [Value Low] [CRC Low] [CRC High]
+    command = bytearray(8)
+    command[0] = slave_id
+    command[1] = function_code
+    command[2] = register >> 8      # High byte of register
+    command[3] = register & 0xFF    # Low byte of register
+    command[4] = value >> 8         # High byte of value
+    command[5] = value & 0xFF       # Low byte of value
+    command[6:8] = calculate_crc(command[:6])
 
     return bytes(command)
 
-def send_modbus_command(command: bytes):
-    try:
-        with serial.Serial(
+_SER = None
+_SER_LOCK = threading.Lock()
+_LAST_WRITE = 0.0
+# Settle time kept between consecutive frames (Modbus RTU delimits frames by line silence).
+FRAME_GAP = 0.1
+
+
+def _get_serial():
+    """Returns the shared serial port, opening it on first use. Call with _SER_LOCK held."""
+    global _SER
+    if _SER is None or not _SER.is_open:
+        _SER = serial.Serial(
             port=SERIAL_PORT,
             baudrate=BAUD_RATE,
             parity=PARITY,
             stopbits=STOP_BITS,
             bytesize=DATA_BITS,
             timeout=TIMEOUT
-        ) as ser:
-            logging.info(f"Connecting to {ser.portstr}")
-            if not ser.is_open:
-                ser.open()
+        )
+        logging.info(f"Connected to {_SER.portstr}")
+    return _SER
+
 
+def _close_serial():
+    global _SER
+    if _SER is not None:
+        _SER.close()
+        _SER = None
+
+
+atexit.register(_close_serial)
+
+
+def send_modbus_command(command: bytes):
+    global _LAST_WRITE
+    with _SER_LOCK:
+        try:
+            ser = _get_serial()
+            ser.reset_input_buffer()
+            wait = _LAST_WRITE + FRAME_GAP - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
             logging.info(f"Sending command: {command.hex().upper()}")
             ser.write(command)
-            time.sleep(0.1)
+            ser.flush()
+            _LAST_WRITE = time.monotonic()
             logging.info("Command sent successfully.")
             return True
 
-    except serial.SerialException as e:
-        logging.error(f"Serial port error: {e}")
-        return False
-    except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}")
-        return False
\ No newline at end of file
+        except serial.SerialException as e:
+            logging.error(f"Serial port error: {e}")
+            # Drop the handle so the next command reopens the port.
+            _close_serial()
+            return False
+        except Exception as e:
+            logging.error(f"An unexpected error occurred: {e}")
+            return False
@@ -1,7 +1,9 @@
 # tools_definition.py (Final and Complete Version)
 
+from functools import lru_cache
 from pydantic import BaseModel, Field
 from typing import Literal
+from device_controller import DEVICE_MAP
 
 
 # -----------------------------------------------------------------------------
@@ -10,10 +12,8 @@ from typing import Literal
 
 class DeviceControlArgs(BaseModel):
     """Arguments for turning a device on or off."""
-    device_id: Literal[
-        "kitchen_lamp", "bathroom_lamp", "room1_lamp", "room2_lamp",
-        "room1_ac", "kitchen_ac", "living_room_tv"
-    ] = Field(..., description="The unique identifier for the hardware device.")
+    # Derived from DEVICE_MAP so the ids the LLM may choose from always match the controllable devices.
+    device_id: Literal[tuple(DEVICE_MAP)] = Field(..., description="The unique identifier for the hardware device.")
 
 
 class WeatherArgs(BaseModel):
@@ -76,12 +76,14 @@ def pydantic_to_json_schema(model: BaseModel, function_name: str, function_descr
 # بخش ۳: تابع اصلی برای دریافت لیست کامل ابزارها
 # -----------------------------------------------------------------------------
 
-def get_tools_schema() -> list:
+@lru_cache(maxsize=1)
+def get_tools_schema() -> tuple:
     """
     Returns a complete list of all defined tools in the required JSON Schema format.
     This is the list that will be sent to the LLM API.
+    The schema is static, so it is only generated once and returned as a tuple that is shared by all callers.
     """
-    tools = [
+    tools = (
         pydantic_to_json_schema(
             model=DeviceControlArgs,
             function_name="turn_on_device",
@@ -112,5 +114,21 @@ def get_tools_schema() -> list:
             function_name="get_news_headlines",
             function_description="Retrieves recent news headlines for a given category and country."
         ),
-    ]
+    )
     return tools
+
+
+@lru_cache(maxsize=1)
+def get_tool_argument_models() -> dict:
+    """
+    Maps every tool name, as sent to the LLM, to the Pydantic model of its arguments.
+    The models parse and validate the raw JSON arguments the LLM returns before a tool is called.
+    """
+    return {
+        "call_turn_on_device": DeviceControlArgs,
+        "call_turn_off_device": DeviceControlArgs,
+        "call_get_current_weather": WeatherArgs,
+        "call_get_current_time": EmptyArgs,
+        "call_get_current_date": EmptyArgs,
+        "call_get_news_headlines": NewsArgs,
+    }